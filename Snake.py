@@ -1,14 +1,26 @@
-import pygame                       #for graphics and game mechanics
 import random                       #for food and barrier placement
 import time                         #for game timing and cooldowns
 import json                         #for storing game statistics
 import math                         #for visual effects (pulsing colors)
+import os                           #for the frame recording output paths
+import queue                        #for the bounded frame queue of the recorder
+import shutil                       #to find a local video encoder (ffmpeg)
+import subprocess                   #to stream frames to the video encoder
+import threading                    #for the background frame encoder
+import argparse                     #for the command-line options
+import importlib                    #to load the AI strategies given on the command line
+import struct                       #for the binary game snapshots
+import sys                          #to write the snapshots always in little-endian
+from concurrent.futures import ProcessPoolExecutor   #to play the evaluation games on all the cores
 from enum import Enum               #for game state constants
 from dataclasses import dataclass   
+from array import array             #for the compact snake body
 from typing import List, Tuple      #for typing hints
 
-# Initialization Pygame
-pygame.init()
+# Pygame is imported and initialized lazily (see init_pygame): headless users of this module never load it
+pygame = None
+# NumPy is only needed by the ObservationRenderer, so it is imported lazily too (see init_numpy)
+np = None
 
 
 # Costants
@@ -26,10 +38,34 @@ NEON_GREEN = (57, 255, 20)
 #game time limit (in seconds)
 GAME_TIME = 180  # 3 minutes 
 
-# Fonts (for differents UI elements)
-FONT_LARGE = pygame.font.Font(None, 48)
-FONT_MEDIUM = pygame.font.Font(None, 36)
-FONT_SMALL = pygame.font.Font(None, 24)
+#how much of the game can be rewound (in seconds)
+REWIND_SECONDS = 30
+
+# Fonts (for differents UI elements): loaded by init_pygame() the first time something is drawn
+FONT_LARGE = None
+FONT_MEDIUM = None
+FONT_SMALL = None
+# Direction associated to each arrow key: set by init_pygame() too (the key codes come from pygame)
+ARROW_DIRECTIONS = {}
+
+#to import pygame and initialize only the modules we need (display and font), the first time rendering is needed
+def init_pygame():
+    global pygame, FONT_LARGE, FONT_MEDIUM, FONT_SMALL, ARROW_DIRECTIONS
+    if pygame is not None:
+        return
+    import pygame
+    pygame.display.init()
+    pygame.font.init()
+    FONT_LARGE = pygame.font.Font(None, 48)
+    FONT_MEDIUM = pygame.font.Font(None, 36)
+    FONT_SMALL = pygame.font.Font(None, 24)
+    ARROW_DIRECTIONS = {pygame.K_UP: (0, -1), pygame.K_DOWN: (0, 1), pygame.K_LEFT: (-1, 0), pygame.K_RIGHT: (1, 0)}
+
+#to import numpy the first time an observation is rendered
+def init_numpy():
+    global np
+    if np is None:
+        import numpy as np
 
 #classes of enumeration
 class Difficulty(Enum):
@@ -47,6 +83,122 @@ class Barrier(Enum):
     RANDOM = "RANDOM"
 
 
+#DRAWING RULES shared by Game.run and the ObservationRenderer
+
+#to get the position (top-left corner of the cell, in pixels) and size of the two eyes of the head, according to the direction
+def snake_eyes(x, y, direction, cell_size=GRID_SIZE):
+    eye_size = cell_size // 4
+    eye_offset = cell_size // 4
+    if direction[0] == 1:  # right
+        left_eye = (x + cell_size - eye_offset, y + eye_offset)
+        right_eye = (x + cell_size - eye_offset, y + cell_size - eye_offset - eye_size)
+    elif direction[0] == -1:  # left
+        left_eye = (x + eye_offset - eye_size, y + eye_offset)
+        right_eye = (x + eye_offset - eye_size, y + cell_size - eye_offset - eye_size)
+    elif direction[1] == -1:  # up
+        left_eye = (x + eye_offset, y + eye_offset - eye_size)
+        right_eye = (x + cell_size - eye_offset - eye_size, y + eye_offset - eye_size)
+    else:  # down
+        left_eye = (x + eye_offset, y + cell_size - eye_offset)
+        right_eye = (x + cell_size - eye_offset - eye_size, y + cell_size - eye_offset)
+    return left_eye, right_eye, eye_size
+
+#Gradient effect for the body: the i-th segment gets darker towards the tail (but never below 30%)
+def body_segment_color(color, i, length):
+    alpha = max(0.3, 1 - i / length)
+    return (int(color[0] * alpha), int(color[1] * alpha), int(color[2] * alpha))
+
+
+#the body of the snake, stored in a preallocated circular buffer of packed cell indices (y * GRID_COUNT + x):
+#adding the head and removing the tail are O(1) and don't allocate anything, and an occupancy grid
+#makes the collision checks O(1) too. Iterating gives the (x, y) cells from the head to the tail.
+class SnakeBody:
+
+    def __init__(self, head):
+        self.capacity = GRID_COUNT * GRID_COUNT
+        self.cells = array('H', bytes(2 * self.capacity))
+        #how many segments are on each cell of the grid
+        self.occupied = bytearray(self.capacity)
+        #the head is at cells[start], the tail at cells[(start + length - 1) % capacity]
+        self.start = 0
+        self.length = 0
+        self.push_head(*head)
+
+    #to add a new head (the snake moves or grows)
+    def push_head(self, x, y):
+        index = y * GRID_COUNT + x
+        self.start = (self.start - 1) % self.capacity
+        self.cells[self.start] = index
+        self.occupied[index] += 1
+        self.length += 1
+
+    #to remove the last segment of the tail
+    def pop_tail(self):
+        self.length -= 1
+        index = self.cells[(self.start + self.length) % self.capacity]
+        self.occupied[index] -= 1
+        return index % GRID_COUNT, index // GRID_COUNT
+
+    #to remove the head (used to undo a move)
+    def pop_head(self):
+        index = self.cells[self.start]
+        self.occupied[index] -= 1
+        self.start = (self.start + 1) % self.capacity
+        self.length -= 1
+        return index
+
+    #to add back a segment (given as packed index) after the tail (used to undo a move)
+    def push_tail(self, index):
+        self.cells[(self.start + self.length) % self.capacity] = index
+        self.occupied[index] += 1
+        self.length += 1
+
+    #packed index of the last segment of the tail
+    @property
+    def tail_index(self):
+        return self.cells[(self.start + self.length - 1) % self.capacity]
+
+    #to replace the whole body with the given packed indices (from the head to the tail)
+    def load_indices(self, indices):
+        self.start = 0
+        self.length = len(indices)
+        self.cells[:self.length] = indices
+        self.occupied = bytearray(self.capacity)
+        for index in indices:
+            self.occupied[index] += 1
+
+    @property
+    def head(self):
+        index = self.cells[self.start]
+        return index % GRID_COUNT, index // GRID_COUNT
+
+    #to check if a cell is occupied by the body (the head excluded), like "pos in snake[1:]"
+    def body_contains(self, pos):
+        index = pos[1] * GRID_COUNT + pos[0]
+        return self.occupied[index] > (1 if index == self.cells[self.start] else 0)
+
+    #to get the packed cell indices from the head to the tail without copying them:
+    #one or two (if the buffer wraps around) memoryviews of the buffer
+    def index_views(self):
+        end = self.start + self.length
+        view = memoryview(self.cells)
+        if end <= self.capacity:
+            return [view[self.start:end]]
+        return [view[self.start:], view[:end - self.capacity]]
+
+    def __len__(self):
+        return self.length
+
+    def __contains__(self, pos):
+        x, y = pos
+        return 0 <= x < GRID_COUNT and 0 <= y < GRID_COUNT and self.occupied[y * GRID_COUNT + x] > 0
+
+    def __iter__(self):
+        for view in self.index_views():
+            for index in view:
+                yield index % GRID_COUNT, index // GRID_COUNT
+
+
 #to create clickable UI buttons
 class Button:
     
@@ -76,22 +228,437 @@ class Button:
     def is_clicked(self, pos):
         return self.rect.collidepoint(pos)
 
+#to buffer the turns of the player: instead of dropping the keys pressed too quickly, the turns are queued
+#and the game applies one of them per movement of the snake
+class TurnQueue:
+
+    def __init__(self, max_turns=3):
+        self.max_turns = max_turns
+        #queued (direction, time of the key press)
+        self.turns = []
+
+    #to queue a turn: it is rejected if the queue is full or if it is a reversal (or a repetition)
+    #of the direction the snake will have once the already queued turns are applied
+    def push(self, direction, pressed_at, current_direction):
+        last_direction = self.turns[-1][0] if self.turns else current_direction
+        if len(self.turns) >= self.max_turns:
+            return False
+        if direction == last_direction or direction == (-last_direction[0], -last_direction[1]):
+            return False
+        self.turns.append((direction, pressed_at))
+        return True
+
+    #to take the next turn to apply (None if there are no queued turns)
+    def pop(self, current_direction):
+        while self.turns:
+            direction, pressed_at = self.turns.pop(0)
+            #check again, against the real direction of the snake
+            if direction != (-current_direction[0], -current_direction[1]):
+                return direction, pressed_at
+        return None
+
+    def clear(self):
+        self.turns = []
+
+#histogram of latencies (in milliseconds, buckets of bucket_ms), e.g. the time between reading a key event and
+#the frame in which the snake is seen moving in the new direction
+class LatencyHistogram:
+
+    def __init__(self, bucket_ms=5, max_ms=500):
+        self.bucket_ms = bucket_ms
+        #the last bucket collects all the latencies >= max_ms
+        self.counts = [0] * (max_ms // bucket_ms + 1)
+        self.total = 0
+
+    def record(self, seconds):
+        bucket = min(int(seconds * 1000) // self.bucket_ms, len(self.counts) - 1)
+        self.counts[bucket] += 1
+        self.total += 1
+
+    #to get the latency (upper edge of the bucket, in ms) below which there are p% of the records
+    def percentile(self, p):
+        if self.total == 0:
+            return None
+        threshold = self.total * p / 100
+        seen = 0
+        for bucket, count in enumerate(self.counts):
+            seen += count
+            if count and seen >= threshold:
+                #the last bucket has no upper edge
+                return (bucket + 1) * self.bucket_ms if bucket < len(self.counts) - 1 else math.inf
+
+    #to get a printable report: percentiles and the non-empty buckets
+    def report(self):
+        if self.total == 0:
+            return "no input latency recorded"
+        lines = [f"input-to-move latency over {self.total} turns (timed from when the key event is read, "
+                 f"so up to one frame after the key press): "
+                 f"p50 <= {self.percentile(50)} ms, p90 <= {self.percentile(90)} ms, p99 <= {self.percentile(99)} ms"]
+        for bucket, count in enumerate(self.counts):
+            if count:
+                start = bucket * self.bucket_ms
+                label = f"{start:>4}-{start + self.bucket_ms} ms" if bucket < len(self.counts) - 1 else f">= {start} ms"
+                lines.append(f"  {label:>14}: {count}")
+        return "\n".join(lines)
+
+#to record the rendered frames: frames are copied out of the screen and encoded by a background thread,
+#so the encoding work never stalls the game loop
+class FrameRecorder:
+
+    #path: a .gif/.mp4/... file (encoded with ffmpeg, that must be installed) or a folder (a path without
+    #extension, or an existing folder) for a PNG sequence.
+    #The output plays at fps frames per second: the frames dropped, or a game running slower than fps,
+    #make it play faster than the game (both are reported when the recording is closed)
+    def __init__(self, path, fps=60, max_queued_frames=120):
+        self.path = path
+        self.fps = fps
+        ext = os.path.splitext(path)[1]
+        self.ffmpeg = None
+        self.folder = None
+        if not ext or os.path.isdir(path):
+            self.folder = path
+        elif ext.lower() == ".png":
+            raise ValueError(f"to record PNG images give a folder, not '{path}'")
+        else:
+            self.ffmpeg = shutil.which("ffmpeg")
+            if self.ffmpeg is None:
+                raise ValueError(f"ffmpeg was not found: it is needed to record '{path}' "
+                                 f"(give a folder instead to record the frames as PNG images)")
+        #exit status of ffmpeg, once the recording is closed
+        self.encoder_status = None
+        #bounded queue: if the encoder falls behind, frames are dropped instead of blocking the game
+        self.frames = queue.Queue(maxsize=max_queued_frames)
+        self.dropped_frames = 0
+        #to measure the frame rate of the recorded games (the pauses between games are not counted)
+        self.captured_frames = 0
+        self.capture_time = 0.0
+        self.last_capture = None
+        self.size = None
+        self.thread = None
+
+    #to copy the current frame of the surface and hand it to the encoder thread
+    def capture(self, surface):
+        if self.thread is None:
+            self.size = surface.get_size()
+            self.thread = threading.Thread(target=self._encode, daemon=True)
+            self.thread.start()
+        now = time.perf_counter()
+        if self.last_capture is not None and now - self.last_capture < 0.5:
+            self.capture_time += now - self.last_capture
+        self.last_capture = now
+        self.captured_frames += 1
+        #a single copy of the pixels is needed anyway (the screen is redrawn on the next frame)
+        try:
+            self.frames.put_nowait(pygame.image.tobytes(surface, "RGB"))
+        except queue.Full:
+            self.dropped_frames += 1
+
+    #to stop the recording: wait until all the queued frames are encoded
+    def close(self):
+        if self.thread is None:
+            return
+        #the queue may be full: wait for room, unless the encoder thread has stopped (e.g. because of an error)
+        while self.thread.is_alive():
+            try:
+                self.frames.put(None, timeout=0.1)
+                break
+            except queue.Full:
+                pass
+        self.thread.join()
+        self.thread = None
+        #the output runs at self.fps: tell if it is faster than the game
+        if self.capture_time > 0:
+            game_fps = (self.captured_frames - 1) / self.capture_time
+            if self.dropped_frames or game_fps < self.fps * 0.95:
+                print(f"recording '{self.path}': {self.dropped_frames} of {self.captured_frames} frames dropped, "
+                      f"the game ran at {game_fps:.1f} fps but the recording plays at {self.fps} fps",
+                      file=sys.stderr)
+
+    #encoder thread: stream the frames to ffmpeg, or save them as a PNG sequence
+    def _encode(self):
+        if self.ffmpeg is not None:
+            self._encode_video()
+        else:
+            self._encode_png_sequence(self.folder)
+
+    def _encode_video(self):
+        width, height = self.size
+        encoder = subprocess.Popen(
+            [self.ffmpeg, "-y", "-loglevel", "error",
+             "-f", "rawvideo", "-pix_fmt", "rgb24", "-s", f"{width}x{height}", "-framerate", str(self.fps),
+             "-i", "-", self.path],
+            stdin=subprocess.PIPE)
+        encoding = True
+        while True:
+            frame = self.frames.get()
+            if frame is None:
+                break
+            #if ffmpeg stopped early, keep emptying the queue (so that the game is never blocked) until the end
+            if encoding:
+                try:
+                    encoder.stdin.write(frame)
+                except OSError:
+                    encoding = False
+        try:
+            encoder.stdin.close()
+        except OSError:
+            pass
+        self.encoder_status = encoder.wait()
+        if self.encoder_status != 0:
+            print(f"ffmpeg exited with status {self.encoder_status}: the recording of '{self.path}' failed",
+                  file=sys.stderr)
+
+    def _encode_png_sequence(self, folder):
+        os.makedirs(folder, exist_ok=True)
+        index = 0
+        while True:
+            frame = self.frames.get()
+            if frame is None:
+                break
+            image = pygame.image.frombytes(frame, self.size, "RGB")
+            pygame.image.save(image, os.path.join(folder, f"frame_{index:05d}.png"))
+            index += 1
+
+#to render game states (anything with snake (a SnakeBody), direction, barriers, food, snake_color and food_color, like a Game)
+#as NumPy RGB images of shape (height, width, 3) without any window, e.g. as observations for pixel-based agents.
+#The board is drawn with the same rules as Game.run (grid, barriers, gradient body, head with eyes, food),
+#scaled to cell_size pixels per cell; particles and texts are not part of the observation.
+class ObservationRenderer:
+
+    def __init__(self, cell_size=1, grid_lines=None):
+        init_numpy()
+        self.cell_size = cell_size
+        self.size = GRID_COUNT * cell_size
+        #scale the insets used by Game.run (1px for the body, 2px for the barriers) to the cell size
+        body_inset = cell_size // GRID_SIZE
+        barrier_inset = 2 * cell_size // GRID_SIZE
+
+        #the tiles (cell_size x cell_size x 3) for every kind of cell are prepared only once
+        #empty cell: background and (only if there is room for them) the grid lines on the top/left edge
+        if grid_lines is None:
+            grid_lines = cell_size >= 4
+        self.empty_tile = np.empty((cell_size, cell_size, 3), dtype=np.uint8)
+        self.empty_tile[:] = DARK_GRAY
+        if grid_lines:
+            self.empty_tile[0, :] = (60, 60, 60)
+            self.empty_tile[:, 0] = (60, 60, 60)
+
+        self.barrier_tile = np.empty((cell_size, cell_size, 3), dtype=np.uint8)
+        self.barrier_tile[:] = RED
+        if barrier_inset > 0:
+            self.barrier_tile[barrier_inset:cell_size - barrier_inset, barrier_inset:cell_size - barrier_inset] = (200, 0, 0)
+
+        #where the body color covers the cell
+        self.body_mask = np.zeros((cell_size, cell_size, 1), dtype=bool)
+        self.body_mask[body_inset:cell_size - body_inset, body_inset:cell_size - body_inset] = True
+
+        #where the eyes are, for every direction
+        self.eye_masks = {}
+        for direction in ((1, 0), (-1, 0), (0, -1), (0, 1)):
+            mask = np.zeros((cell_size, cell_size, 1), dtype=bool)
+            left_eye, right_eye, eye_size = snake_eyes(0, 0, direction, cell_size)
+            for eye_x, eye_y in (left_eye, right_eye):
+                mask[eye_y:eye_y + eye_size, eye_x:eye_x + eye_size] = True
+            self.eye_masks[direction] = mask
+
+    #to allocate an array for a batch of n observations (can be reused across calls to render_batch)
+    def allocate(self, n):
+        return np.empty((n, self.size, self.size, 3), dtype=np.uint8)
+
+    #to render a single state (into out, if given)
+    def render(self, state, out=None):
+        if out is None:
+            out = self.allocate(1)[0]
+        self._check_output(out, (self.size, self.size, 3))
+        self._draw(state, out)
+        return out
+
+    #to render a batch of states into one preallocated array of shape (len(states), size, size, 3)
+    def render_batch(self, states, out=None):
+        if out is None:
+            out = self.allocate(len(states))
+        self._check_output(out, (len(states), self.size, self.size, 3))
+        for image, state in zip(out, states):
+            self._draw(state, image)
+        return out
+
+    def _check_output(self, out, shape):
+        if out.shape != shape or out.dtype != np.uint8 or not out.flags.c_contiguous:
+            raise ValueError(f"out must be a C-contiguous uint8 array of shape {shape}")
+
+    def _draw(self, state, image):
+        c = self.cell_size
+        #view the image as a GRID_COUNT x GRID_COUNT grid of tiles: cells[y, x] is the tile of the cell (x, y)
+        cells = image.reshape(GRID_COUNT, c, GRID_COUNT, c, 3).swapaxes(1, 2)
+        cells[:] = self.empty_tile
+
+        #barriers
+        if state.barriers:
+            xs, ys = np.array(state.barriers).T
+            cells[ys, xs] = self.barrier_tile
+
+        #snake: body with the gradient effect, then the head with the eyes
+        indices = np.concatenate([np.frombuffer(view, dtype=np.uint16) for view in state.snake.index_views()])
+        snake_ys, snake_xs = np.divmod(indices, GRID_COUNT)
+        color = np.array(state.snake_color, dtype=np.float64)
+        length = len(indices)
+        if length > 1:
+            alpha = np.maximum(0.3, 1 - np.arange(1, length) / length)
+            colors = (color * alpha[:, None]).astype(np.uint8)
+            body_ys, body_xs = snake_ys[1:], snake_xs[1:]
+            cells[body_ys, body_xs] = np.where(self.body_mask, colors[:, None, None, :], cells[body_ys, body_xs])
+        head_x, head_y = snake_xs[0], snake_ys[0]
+        cells[head_y, head_x] = np.where(self.eye_masks[tuple(state.direction)], WHITE, color.astype(np.uint8))
+
+        #food
+        cells[state.food[1], state.food[0]] = state.food_color
+
+#BINARY SNAPSHOTS of the state of a game (see Game.snapshot and Game.restore), all little-endian:
+#header, then the packed cells (y * GRID_COUNT + x, uint16) of the snake (from the head) and of the barriers,
+#then the particles
+SNAPSHOT_MAGIC = b"SNAK"
+SNAPSHOT_VERSION = 2
+#magic, version, grid count, settings (difficulty, mode, barrier, color change), direction, next direction, food,
+#score, elapsed time, snake color, food color, snake length, number of barriers, number of particles
+SNAPSHOT_HEADER = struct.Struct("<4sBB4B2b2b2BId3B3BHHH")
+#value of the settings in a snapshot of a game without settings
+SNAPSHOT_NO_SETTINGS = 0xFF
+#position, velocity, time to live, color
+SNAPSHOT_PARTICLE = struct.Struct("<5f3B")
+
+#array of uint16 in little-endian bytes (and back)
+def _pack_cells(cells):
+    if sys.byteorder == "big":
+        cells = array('H', cells)
+        cells.byteswap()
+    return cells.tobytes()
+
+def _unpack_cells(data):
+    cells = array('H', data)
+    if sys.byteorder == "big":
+        cells.byteswap()
+    return cells
+
+#to rewind (and replay again) the last ticks of a game: for every move of the snake a fixed-size delta
+#(what the move changed: the values before and after it) is stored in a preallocated ring buffer
+class RewindBuffer:
+
+    #direction, next direction, score, food, snake color and food color before the move and after it,
+    #then the new head and the removed tail (NO_CELL if the snake grew)
+    DELTA = struct.Struct("<2b2bIH3B3B2b2bIH3B3BHH")
+    NO_CELL = 0xFFFF
+
+    def __init__(self, max_ticks):
+        self.max_ticks = max_ticks
+        self.deltas = bytearray(self.DELTA.size * max_ticks)
+        #index of the slot of the next delta
+        self.position = 0
+        #ticks that can be undone (before position) and redone (from position)
+        self.undo_count = 0
+        self.redo_count = 0
+
+    #to save the values that a move can change (called before the move)
+    def capture(self, game):
+        return (game.direction, game.next_direction, game.score, game.food, game.snake_color, game.food_color,
+                game.snake.tail_index, len(game.snake))
+
+    #to store the delta of a move (called after the move, with what capture returned before it)
+    def record(self, game, before):
+        direction, next_direction, score, food, snake_color, food_color, tail_index, length = before
+        #if the snake has the same length the tail was removed, otherwise the snake grew
+        removed_tail = tail_index if len(game.snake) == length else self.NO_CELL
+        self.DELTA.pack_into(self.deltas, self.position * self.DELTA.size,
+                             *direction, *next_direction, score, food[1] * GRID_COUNT + food[0], *snake_color, *food_color,
+                             *game.direction, *game.next_direction, game.score, game.food[1] * GRID_COUNT + game.food[0],
+                             *game.snake_color, *game.food_color,
+                             game.snake.cells[game.snake.start], removed_tail)
+        self.position = (self.position + 1) % self.max_ticks
+        self.undo_count = min(self.undo_count + 1, self.max_ticks)
+        #a new move makes the undone ticks impossible to replay
+        self.redo_count = 0
+
+    #to undo up to ticks moves: returns how many were undone
+    def undo(self, game, ticks=1):
+        ticks = min(ticks, self.undo_count)
+        for _ in range(ticks):
+            self.position = (self.position - 1) % self.max_ticks
+            values = self.DELTA.unpack_from(self.deltas, self.position * self.DELTA.size)
+            game.snake.pop_head()
+            if values[-1] != self.NO_CELL:
+                game.snake.push_tail(values[-1])
+            self._set_values(game, values[:12])
+        self.undo_count -= ticks
+        self.redo_count += ticks
+        #the particles are only a visual effect: they are not part of the deltas
+        game.particle_effects = []
+        return ticks
+
+    #to replay up to ticks undone moves: returns how many were replayed
+    def redo(self, game, ticks=1):
+        ticks = min(ticks, self.redo_count)
+        for _ in range(ticks):
+            values = self.DELTA.unpack_from(self.deltas, self.position * self.DELTA.size)
+            head, removed_tail = values[-2:]
+            game.snake.push_head(head % GRID_COUNT, head // GRID_COUNT)
+            if removed_tail != self.NO_CELL:
+                game.snake.pop_tail()
+            self._set_values(game, values[12:24])
+            self.position = (self.position + 1) % self.max_ticks
+        self.undo_count += ticks
+        self.redo_count -= ticks
+        return ticks
+
+    def clear(self):
+        self.position = 0
+        self.undo_count = 0
+        self.redo_count = 0
+
+    def _set_values(self, game, values):
+        game.direction = values[0:2]
+        game.next_direction = values[2:4]
+        game.score = values[4]
+        game.food = (values[5] % GRID_COUNT, values[5] // GRID_COUNT)
+        game.snake_color = values[6:9]
+        game.food_color = values[9:12]
+
 #the main class that contain ALL THE GAME LOGIC
 class Game:
-    def __init__(self):
-        self.screen = pygame.display.set_mode((WINDOW_SIZE, WINDOW_SIZE))
-        pygame.display.set_caption("The Snake")
+    #with_stats: load the saved statistics (not needed by headless games)
+    def __init__(self, recorder=None, with_stats=True):
+        #optional FrameRecorder: if set, every frame of the game loop is recorded
+        self.recorder = recorder
+        #the window is opened only when needed (see open_display), so a Game can also be used headless
+        self.screen = None
         #to control the framrate of the game
-        self.clock = pygame.time.Clock()     
-        #to prevent the player from changing direction too quickly
-        self.last_direction_change = time.time()
-        self.direction_change_cooldown = 0.1
+        self.clock = None
+        #turns pressed by the player and not yet applied (one is applied at each movement of the snake)
+        self.turn_queue = TurnQueue()
+        #latency between reading a key event and the frame that shows the snake turning (pygame gives no time of
+        #the key press: the events are read once per frame, so the time before the read, up to one frame, is not counted)
+        self.input_latency = LatencyHistogram()
+        #optional RewindBuffer: if set, every move of the snake is recorded so that it can be undone
+        self.rewind = None
+        #settings of the current game (difficulty, mode, barrier, color_change, like the ones chosen in the menu):
+        #they are saved in the snapshots, so that a restored game follows the same rules
+        self.settings = None
 
         self.barriers = []
         self.reset_game()
-        self.load_stats()
+        if with_stats:
+            self.load_stats()
+        else:
+            self.stats = []
         self.game_quit = False
 
+    #to open the game window (and initialize pygame) the first time something has to be drawn
+    def open_display(self):
+        if self.screen is not None:
+            return
+        init_pygame()
+        self.screen = pygame.display.set_mode((WINDOW_SIZE, WINDOW_SIZE))
+        pygame.display.set_caption("The Snake")
+        self.clock = pygame.time.Clock()
+
     #to spawn the food using 100 attempts, and a Fallback strategy after the 100th attemps
     def spawn_food(self):
         attempts = 0
@@ -159,11 +726,104 @@ class Game:
         self.barriers.extend([(0, y) for y in range(GRID_COUNT)])       #left edge
         self.barriers.extend([(GRID_COUNT-1, y) for y in range(GRID_COUNT)])        #right edge
 
+    #to create the barriers of the chosen type
+    def create_barriers(self, barrier_type):
+        if barrier_type == Barrier.BORDER:
+            self.create_border_barriers()
+        elif barrier_type == Barrier.RANDOM:
+            self.create_random_barriers()
+        #the food was spawned before the barriers: move it if it is now on a barrier
+        if self.food in self.barriers:
+            self.food = self.spawn_food()
+
     #to allow the "wrap-around": the snake can cross the edges and reappear from the opposite side
     def wrap_position(self, pos):
         x, y = pos
         return (x % GRID_COUNT, y % GRID_COUNT)
 
+    #to calculate where the head goes moving in the given direction: returns None if the snake crashes there
+    def next_head(self, direction, barrier_type):
+        head = self.snake.head
+        new_head = (head[0] + direction[0], head[1] + direction[1])
+
+        #collisions management
+        #NORMAL MODE
+        if barrier_type == Barrier.NONE:
+            new_head = self.wrap_position(new_head)
+            #Check collision with body only
+            if self.snake.body_contains(new_head):
+                return None
+        #RANDOM BARRIERS MODE
+        elif barrier_type == Barrier.RANDOM:
+            #check collision with random barriers
+            if new_head in self.barriers:
+                return None
+            new_head = self.wrap_position(new_head)
+            #Check collision with body
+            if self.snake.body_contains(new_head):
+                return None
+        #BORDER MODE
+        else:
+            #check collision with wall and with body
+            if (new_head[0] < 0 or new_head[0] >= GRID_COUNT or
+                new_head[1] < 0 or new_head[1] >= GRID_COUNT or
+                new_head in self.barriers or
+                self.snake.body_contains(new_head)):
+                return None
+        return new_head
+
+    #to move the snake by one cell in the next direction (one tick of the game, without any drawing),
+    #turning first in the direction turn if given: returns False if the snake crashed (game over)
+    def step(self, barrier_type, color_change=False, move_delay=Difficulty.EASY.value, turn=None):
+        #the state is captured before the turn, so that undoing the move also undoes the turn
+        before = self.rewind.capture(self) if self.rewind is not None else None
+        if turn is not None:
+            self.next_direction = turn
+        self.direction = self.next_direction
+        #The new position of the snake’s head is calculated
+        new_head = self.next_head(self.direction, barrier_type)
+        if new_head is None:
+            return False
+
+        #the snake grow constantly (but if he didn't eat, he also reduces constantly-see the else condition: the result is that remain the same if don't eat)
+        self.snake.push_head(*new_head)
+
+        #if the snake eats food
+        if new_head == self.food:
+            self.score += 10
+            if color_change:
+                self.snake_color = self.food_color
+
+            #new food is generated
+            self.food = self.spawn_food()
+            self.food_color = self.pulse_color()
+
+            #Coloured particles are generated when food is eaten
+            for _ in range(10):
+                self.particle_effects.append({
+                    'pos': (new_head[0] * GRID_SIZE + GRID_SIZE//2,
+                          new_head[1] * GRID_SIZE + GRID_SIZE//2),
+                    'vel': (random.uniform(-2, 2), random.uniform(-2, 2)),
+                    'ttl': 1.0,  # Time to live
+                    'color': self.food_color
+                })
+        else:
+            #if the snake didn't eat: Last tail segment is removed (the snake does not grow)
+            self.snake.pop_tail()
+
+        # Update particles: The particles move and disappear gradually
+        for particle in self.particle_effects[:]:
+            particle['ttl'] -= move_delay
+            if particle['ttl'] <= 0:
+                self.particle_effects.remove(particle)
+            else:
+                particle['pos'] = (particle['pos'][0] + particle['vel'][0],
+                                 particle['pos'][1] + particle['vel'][1])
+
+        if before is not None:
+            self.rewind.record(self, before)
+        return True
+
     #to load the stats from a json file called "snake_stats.json"
     def load_stats(self):
         try:
@@ -179,6 +839,103 @@ class Game:
         with open('snake_stats.json', 'w') as f:
             json.dump(self.stats, f)
 
+    #to get a compact binary snapshot of the state of the game (see SNAPSHOT_HEADER)
+    def snapshot(self):
+        particles = self.particle_effects
+        if self.settings is not None:
+            settings = (list(Difficulty).index(self.settings['difficulty']), list(GameMode).index(self.settings['mode']),
+                        list(Barrier).index(self.settings['barrier']), int(self.settings['color_change']))
+        else:
+            settings = (SNAPSHOT_NO_SETTINGS,) * 4
+        header = SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, GRID_COUNT, *settings,
+                                      *self.direction, *self.next_direction, *self.food, self.score,
+                                      time.time() - self.start_time, *self.snake_color, *self.food_color,
+                                      len(self.snake), len(self.barriers), len(particles))
+        snake = b"".join(_pack_cells(view) for view in self.snake.index_views())
+        barriers = _pack_cells(array('H', [y * GRID_COUNT + x for x, y in self.barriers]))
+        particle_data = bytearray(SNAPSHOT_PARTICLE.size * len(particles))
+        for i, particle in enumerate(particles):
+            SNAPSHOT_PARTICLE.pack_into(particle_data, i * SNAPSHOT_PARTICLE.size,
+                                        *particle['pos'], *particle['vel'], particle['ttl'], *particle['color'][:3])
+        return header + snake + barriers + bytes(particle_data)
+
+    #to restore the state of the game from a snapshot (e.g. to resume a game, or to branch from a position)
+    #the whole snapshot is checked before changing anything: a ValueError leaves the game as it was
+    def restore(self, data):
+        if len(data) < SNAPSHOT_HEADER.size:
+            raise ValueError("the snapshot is truncated")
+        (magic, version, grid_count, difficulty, mode, barrier, color_change, dx, dy, next_dx, next_dy, food_x, food_y, score, elapsed,
+         snake_r, snake_g, snake_b, food_r, food_g, food_b,
+         snake_length, barrier_count, particle_count) = SNAPSHOT_HEADER.unpack_from(data)
+        if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+            raise ValueError("not a snapshot of this version of the game")
+        if grid_count != GRID_COUNT:
+            raise ValueError(f"the snapshot is for a {grid_count}x{grid_count} grid")
+        if len(data) != (SNAPSHOT_HEADER.size + 2 * (snake_length + barrier_count)
+                         + particle_count * SNAPSHOT_PARTICLE.size):
+            raise ValueError("the size of the snapshot does not match its header")
+
+        #check the values
+        settings = (difficulty, mode, barrier, color_change)
+        has_settings = settings != (SNAPSHOT_NO_SETTINGS,) * 4
+        if has_settings and not (difficulty < len(Difficulty) and mode < len(GameMode)
+                                 and barrier < len(Barrier) and color_change in (0, 1)):
+            raise ValueError("the snapshot has invalid settings")
+        directions = ((0, -1), (0, 1), (-1, 0), (1, 0))
+        if (dx, dy) not in directions or (next_dx, next_dy) not in directions:
+            raise ValueError("the snapshot has an invalid direction")
+        if not (1 <= snake_length <= GRID_COUNT * GRID_COUNT):
+            raise ValueError("the snapshot has an invalid snake length")
+        if not (0 <= food_x < GRID_COUNT and 0 <= food_y < GRID_COUNT):
+            raise ValueError("the snapshot has the food out of the grid")
+        offset = SNAPSHOT_HEADER.size
+        snake = _unpack_cells(data[offset:offset + 2 * snake_length])
+        offset += 2 * snake_length
+        barriers = _unpack_cells(data[offset:offset + 2 * barrier_count])
+        offset += 2 * barrier_count
+        if max(snake) >= GRID_COUNT * GRID_COUNT or max(barriers, default=0) >= GRID_COUNT * GRID_COUNT:
+            raise ValueError("the snapshot has cells out of the grid")
+        particles = []
+        for _ in range(particle_count):
+            x, y, vx, vy, ttl, r, g, b = SNAPSHOT_PARTICLE.unpack_from(data, offset)
+            particles.append({'pos': (x, y), 'vel': (vx, vy), 'ttl': ttl, 'color': (r, g, b)})
+            offset += SNAPSHOT_PARTICLE.size
+
+        #the rules of the saved game replace the current ones
+        if has_settings:
+            if self.settings is None:
+                self.settings = {}
+            self.settings.update({
+                'difficulty': list(Difficulty)[difficulty],
+                'mode': list(GameMode)[mode],
+                'barrier': list(Barrier)[barrier],
+                'color_change': bool(color_change),
+            })
+
+        self.snake.load_indices(snake)
+        self.barriers = [(index % GRID_COUNT, index // GRID_COUNT) for index in barriers]
+        self.particle_effects = particles
+        self.direction = (dx, dy)
+        self.next_direction = (next_dx, next_dy)
+        self.food = (food_x, food_y)
+        self.score = score
+        self.start_time = time.time() - elapsed
+        self.snake_color = (snake_r, snake_g, snake_b)
+        self.food_color = (food_r, food_g, food_b)
+        self.turn_queue.clear()
+        #the moves recorded before do not lead to this state anymore
+        if self.rewind is not None:
+            self.rewind.clear()
+
+    #to save/load the game to/from a snapshot file
+    def save_snapshot(self, path):
+        with open(path, 'wb') as f:
+            f.write(self.snapshot())
+
+    def load_snapshot(self, path):
+        with open(path, 'rb') as f:
+            self.restore(f.read())
+
     #to reset stats
     def reset_stats(self):
         self.stats = []
@@ -187,11 +944,13 @@ class Game:
     #to reset the game
     def reset_game(self):
         #the snake start from the center
-        self.snake = [(GRID_COUNT//2, GRID_COUNT//2)]
+        self.snake = SnakeBody((GRID_COUNT//2, GRID_COUNT//2))
         #starting direction (goes to the right)
         self.direction = (1, 0)
         #next direction (to avoid multiple input)
         self.next_direction = (1, 0)
+        #no turns waiting from the previous game
+        self.turn_queue.clear()
         #no barrier at the beginning
         self.barriers = []
         #generate food
@@ -396,6 +1155,7 @@ class Game:
 
     #main game loop
     def run(self):
+        self.open_display()
         while True:
             #show the menu with the chosen settings
             settings = self.main_menu()
@@ -404,21 +1164,23 @@ class Game:
 
             #reset the state of the game    
             self.reset_game()
+            self.settings = settings
             
             #if the player chosed the mode with Barriers: create the right barriers
-            if settings['barrier'] == Barrier.BORDER:
-                self.create_border_barriers()
-            elif settings['barrier'] == Barrier.RANDOM:
-                self.create_random_barriers()
+            self.create_barriers(settings['barrier'])
 
             #START OF THE GAME 
             game_over = False
             #save the starting game time
-            start_time = time.time()
+            self.start_time = time.time()
             #save the ending game time
             last_move_time = time.time()
             #set the speed of the snake according to the chosen difficulty
             move_delay = settings['difficulty'].value
+            #times the key events of the turns applied in this frame were read (to measure the latency when they are shown)
+            applied_turns = []
+            #to rewind the last REWIND_SECONDS of the game
+            self.rewind = RewindBuffer(int(REWIND_SECONDS / move_delay))
             
             #GAME LOOP
             while not game_over:
@@ -434,97 +1196,41 @@ class Game:
                         if event.key == pygame.K_ESCAPE:
                             self.game_quit = True
                             game_over = True
-                        #change direction using UP,DOWN,LEFT,RIGHT     
-                        elif current_time - self.last_direction_change >= self.direction_change_cooldown:
-                            if event.key == pygame.K_UP and self.direction != (0, 1):
-                                self.next_direction = (0, -1)
-                                #cooldown to avoid changes of direction too fast
-                                self.last_direction_change = current_time
-                            elif event.key == pygame.K_DOWN and self.direction != (0, -1):
-                                self.next_direction = (0, 1)
-                                self.last_direction_change = current_time
-                            elif event.key == pygame.K_LEFT and self.direction != (1, 0):
-                                self.next_direction = (-1, 0)
-                                self.last_direction_change = current_time
-                            elif event.key == pygame.K_RIGHT and self.direction != (-1, 0):
-                                self.next_direction = (1, 0)
-                                self.last_direction_change = current_time
+                        #F5: save the game to a file, F9: load it back
+                        elif event.key == pygame.K_F5:
+                            self.save_snapshot('snake_save.bin')
+                        elif event.key == pygame.K_F9 and os.path.exists('snake_save.bin'):
+                            #the saved game can have different settings (updated in settings by load_snapshot)
+                            try:
+                                self.load_snapshot('snake_save.bin')
+                            except (ValueError, struct.error, OSError) as error:
+                                #an invalid (or old) save: keep playing the current game
+                                print(f"could not load snake_save.bin: {error}", file=sys.stderr)
+                            else:
+                                move_delay = settings['difficulty'].value
+                                self.rewind = RewindBuffer(int(REWIND_SECONDS / move_delay))
+                        #R: go back 3 seconds
+                        elif event.key == pygame.K_r:
+                            self.rewind.undo(self, int(3 / move_delay))
+                            self.turn_queue.clear()
+                        #change direction using UP,DOWN,LEFT,RIGHT: the turn is queued and applied at the next movement
+                        elif event.key in ARROW_DIRECTIONS:
+                            self.turn_queue.push(ARROW_DIRECTIONS[event.key], time.perf_counter(), self.direction)
 
                 #The snake moves only after the time set by the difficulty has passed
                 if current_time - last_move_time >= move_delay:
-                    #snake's movement
-                    self.direction = self.next_direction
+                    #snake's movement (applying the next queued turn, if any)
+                    turn = self.turn_queue.pop(self.direction)
+                    if turn is not None:
+                        applied_turns.append(turn[1])
                     last_move_time = current_time
-                    #The new position of the snake’s head is calculated
-                    head = self.snake[0]
-                    new_head = (head[0] + self.direction[0], head[1] + self.direction[1])
-
-                    #collisions management
-                    #NORMAL MODE
-                    if settings['barrier'] == Barrier.NONE:
-                        new_head = self.wrap_position(new_head)
-                        #Check collision with body only
-                        if new_head in self.snake[1:]:  
-                            game_over = True
-                            continue
-                    #RANDOM BARRIERS MODE
-                    elif settings['barrier'] == Barrier.RANDOM:
-                        #check collision with random barriers
-                        if new_head in self.barriers:
-                            game_over = True
-                            continue
-                        new_head = self.wrap_position(new_head)
-                        #Check collision with body
-                        if new_head in self.snake[1:]:
-                            game_over = True
-                            continue
-                    #BORDER MODE
-                    else:
-                        #check collision with body and with wall
-                        if (new_head in self.snake[1:] or 
-                            new_head in self.barriers or 
-                            new_head[0] < 0 or new_head[0] >= GRID_COUNT or 
-                            new_head[1] < 0 or new_head[1] >= GRID_COUNT):
-                            game_over = True
-                            continue
-                    
-                    #the snake grow constantly (but if he didn't eat, he also reduces constantly-see the else condition: the result is that remain the same if don't eat)
-                    self.snake.insert(0, new_head)
-                    
-                    #if the snake eats food
-                    if new_head == self.food:
-                        self.score += 10
-                        if settings['color_change']:
-                            self.snake_color = self.food_color
-
-                        #new food is generated
-                        self.food = self.spawn_food()
-                        self.food_color = self.pulse_color()
-                        
-                        #Coloured particles are generated when food is eaten
-                        for _ in range(10):
-                            self.particle_effects.append({
-                                'pos': (new_head[0] * GRID_SIZE + GRID_SIZE//2, 
-                                      new_head[1] * GRID_SIZE + GRID_SIZE//2),
-                                'vel': (random.uniform(-2, 2), random.uniform(-2, 2)),
-                                'ttl': 1.0,  # Time to live
-                                'color': self.food_color
-                            })
-                    else:
-                        #if the snake didn't eat: Last tail segment is removed (the snake does not grow)
-                        self.snake.pop()
-
-                    # Update particles: The particles move and disappear gradually
-                    for particle in self.particle_effects[:]:
-                        particle['ttl'] -= move_delay
-                        if particle['ttl'] <= 0:
-                            self.particle_effects.remove(particle)
-                        else:
-                            particle['pos'] = (particle['pos'][0] + particle['vel'][0],
-                                             particle['pos'][1] + particle['vel'][1])
+                    if not self.step(settings['barrier'], settings['color_change'], move_delay,
+                                     turn[0] if turn is not None else None):
+                        game_over = True
+                        continue
 
                 # Win/time control
-                current_time = time.time() - start_time
+                current_time = time.time() - self.start_time
                 remaining_time = GAME_TIME - current_time
                 
                 #If the player has reached 1,000,000 points (impossible scenario), he wins
@@ -554,6 +1260,7 @@ class Game:
                                    GRID_SIZE - 4, GRID_SIZE - 4))
 
                 #snake
+                snake_length = len(self.snake)
                 for i, segment in enumerate(self.snake):
                     color = self.snake_color
                     #HEAD
@@ -562,37 +1269,13 @@ class Game:
                                       (segment[0] * GRID_SIZE, segment[1] * GRID_SIZE,
                                        GRID_SIZE, GRID_SIZE))
                         #EYES
-                        eye_color = (255, 255, 255)
-                        eye_size = GRID_SIZE // 4
-                        eye_offset = GRID_SIZE // 4
-                        if self.direction[0] == 1:  # right
-                            left_eye = (segment[0] * GRID_SIZE + GRID_SIZE - eye_offset, 
-                                      segment[1] * GRID_SIZE + eye_offset)
-                            right_eye = (segment[0] * GRID_SIZE + GRID_SIZE - eye_offset, 
-                                       segment[1] * GRID_SIZE + GRID_SIZE - eye_offset - eye_size)
-                        elif self.direction[0] == -1:  # left
-                            left_eye = (segment[0] * GRID_SIZE + eye_offset - eye_size, 
-                                      segment[1] * GRID_SIZE + eye_offset)
-                            right_eye = (segment[0] * GRID_SIZE + eye_offset - eye_size, 
-                                       segment[1] * GRID_SIZE + GRID_SIZE - eye_offset - eye_size)
-                        elif self.direction[1] == -1:  # up
-                            left_eye = (segment[0] * GRID_SIZE + eye_offset, 
-                                      segment[1] * GRID_SIZE + eye_offset - eye_size)
-                            right_eye = (segment[0] * GRID_SIZE + GRID_SIZE - eye_offset - eye_size, 
-                                       segment[1] * GRID_SIZE + eye_offset - eye_size)
-                        else:  # down
-                            left_eye = (segment[0] * GRID_SIZE + eye_offset, 
-                                      segment[1] * GRID_SIZE + GRID_SIZE - eye_offset)
-                            right_eye = (segment[0] * GRID_SIZE + GRID_SIZE - eye_offset - eye_size, 
-                                       segment[1] * GRID_SIZE + GRID_SIZE - eye_offset)
-                        pygame.draw.rect(self.screen, eye_color, (*left_eye, eye_size, eye_size))
-                        pygame.draw.rect(self.screen, eye_color, (*right_eye, eye_size, eye_size))
+                        left_eye, right_eye, eye_size = snake_eyes(segment[0] * GRID_SIZE, segment[1] * GRID_SIZE,
+                                                                   self.direction)
+                        pygame.draw.rect(self.screen, WHITE, (*left_eye, eye_size, eye_size))
+                        pygame.draw.rect(self.screen, WHITE, (*right_eye, eye_size, eye_size))
                     else:
                         #Gradient effect for the body
-                        alpha = max(0.3, 1 - i / len(self.snake))
-                        segment_color = (int(color[0] * alpha), 
-                                       int(color[1] * alpha), 
-                                       int(color[2] * alpha))
+                        segment_color = body_segment_color(color, i, snake_length)
                         pygame.draw.rect(self.screen, segment_color,
                                       (segment[0] * GRID_SIZE + 1, segment[1] * GRID_SIZE + 1,
                                        GRID_SIZE - 2, GRID_SIZE - 2))
@@ -629,6 +1312,12 @@ class Game:
                     self.screen.blit(time_text, time_rect)
 
                 pygame.display.flip()
+                #the applied turns are now visible on the screen
+                for pressed_at in applied_turns:
+                    self.input_latency.record(time.perf_counter() - pressed_at)
+                applied_turns.clear()
+                if self.recorder is not None:
+                    self.recorder.capture(self.screen)
                 self.clock.tick(60)  
 
             # Show the Game Over screen (only if the game is over and the player did not press ESC to exit: not self.game_quit)
@@ -642,7 +1331,7 @@ class Game:
                         'score': self.score,
                         'mode': settings['mode'].name,
                         'difficulty': settings['difficulty'].name,
-                        'duration': time.time() - start_time
+                        'duration': time.time() - self.start_time
                     })
                     #writes the data to a json file to keep it even after the game is closed
                     self.save_stats()
@@ -806,6 +1495,209 @@ class Game:
             pygame.display.flip()
             self.clock.tick(60)
 
+#AI STRATEGIES AND HEADLESS EVALUATION
+#A strategy is a function strategy(game, barrier_type) that returns the direction the snake should take at the next move
+
+#to get the directions the snake can take without crashing at the next move (reversal excluded)
+def safe_directions(game, barrier_type):
+    reverse = (-game.direction[0], -game.direction[1])
+    return [direction for direction in ((0, -1), (0, 1), (-1, 0), (1, 0))
+            if direction != reverse and game.next_head(direction, barrier_type) is not None]
+
+#random strategy: any direction that does not crash at the next move
+def random_strategy(game, barrier_type):
+    directions = safe_directions(game, barrier_type)
+    return random.choice(directions) if directions else game.direction
+
+#greedy strategy: the safe direction that brings the head closest to the food (the edges wrap around, except in BORDER mode)
+def greedy_strategy(game, barrier_type):
+    def distance(pos):
+        dx = abs(pos[0] - game.food[0])
+        dy = abs(pos[1] - game.food[1])
+        if barrier_type != Barrier.BORDER:
+            dx = min(dx, GRID_COUNT - dx)
+            dy = min(dy, GRID_COUNT - dy)
+        return dx + dy
+
+    directions = safe_directions(game, barrier_type)
+    if not directions:
+        return game.direction
+    return min(directions, key=lambda direction: distance(game.next_head(direction, barrier_type)))
+
+#built-in strategies (other strategies can be given as "module:function")
+STRATEGIES = {
+    'greedy': greedy_strategy,
+    'random': random_strategy,
+}
+
+def load_strategy(name):
+    if name in STRATEGIES:
+        return STRATEGIES[name]
+    module_name, _, function_name = name.partition(":")
+    if not function_name:
+        raise ValueError(f"unknown strategy '{name}' (use one of {', '.join(STRATEGIES)} or module:function)")
+    return getattr(importlib.import_module(module_name), function_name)
+
+#to play a whole game without window with the given strategy and settings, using a simulated clock:
+#every move takes the same time as in Game.run (see below), so TIME mode ends after GAME_TIME simulated seconds.
+#max_ticks stops the games that would never end (a strategy stuck in a loop): these games are marked as capped.
+def play_headless(strategy_name, difficulty, game_mode, barrier_type, seed, max_ticks=20000):
+    random.seed(seed)
+    strategy = load_strategy(strategy_name)
+    game = Game(with_stats=False)
+    game.settings = {'difficulty': difficulty, 'mode': game_mode, 'barrier': barrier_type, 'color_change': False}
+    game.create_barriers(barrier_type)
+
+    move_delay = difficulty.value
+    #Game.run draws 60 frames per second and moves the snake only on a frame: a move really takes the time set by
+    #the difficulty rounded up to a whole number of frames (e.g. EASY: 9 frames, 0.15 s instead of 0.14 s)
+    frames_per_move = math.ceil(round(move_delay * 60, 6))
+    move_time = frames_per_move / 60
+    time_limit_ticks = int(round(GAME_TIME / move_time, 6)) if game_mode == GameMode.TIME else math.inf
+    ticks = 0
+    foods = 0
+    crashed = False
+    capped = False
+    while ticks < time_limit_ticks:
+        if ticks >= max_ticks:
+            capped = True
+            break
+        direction = strategy(game, barrier_type)
+        #a reversal is ignored, like in the real game
+        if direction == (-game.direction[0], -game.direction[1]):
+            direction = None
+        score = game.score
+        if not game.step(barrier_type, move_delay=move_delay, turn=direction):
+            crashed = True
+            break
+        ticks += 1
+        if game.score > score:
+            foods += 1
+        if game_mode == GameMode.POINTS and game.score >= 1000000:
+            break
+
+    return {
+        'strategy': strategy_name,
+        'difficulty': difficulty.name,
+        'mode': game_mode.name,
+        'barrier': barrier_type.name,
+        'seed': seed,
+        'score': game.score,
+        'ticks': ticks,
+        'foods': foods,
+        'crashed': crashed,
+        'capped': capped,
+    }
+
+#to be used with executor.map (the arguments of a match are packed in a tuple)
+def _play_headless_match(match):
+    return play_headless(*match)
+
+#nearest-rank percentile of a list of values
+def percentile(values, p):
+    values = sorted(values)
+    rank = max(1, math.ceil(len(values) * p / 100))
+    return values[rank - 1]
+
+#to play games_per_setting seeded games for every strategy and every Difficulty x Barrier x GameMode combination,
+#distributed on all the cores (or on workers processes), and to aggregate the results for each combination
+def evaluate(strategy_names, games_per_setting=10, seed=0, workers=None, max_ticks=20000):
+    #check the strategies before starting the workers
+    for name in strategy_names:
+        load_strategy(name)
+    matches = [(name, difficulty, game_mode, barrier_type, seed + k, max_ticks)
+               for name in strategy_names
+               for difficulty in Difficulty
+               for barrier_type in Barrier
+               for game_mode in GameMode
+               for k in range(games_per_setting)]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        results = list(executor.map(_play_headless_match, matches, chunksize=max(1, games_per_setting // 2)))
+
+    groups = {}
+    for result in results:
+        key = (result['strategy'], result['difficulty'], result['barrier'], result['mode'])
+        groups.setdefault(key, []).append(result)
+
+    report = []
+    for (strategy_name, difficulty, barrier, mode), games in groups.items():
+        scores = [game['score'] for game in games]
+        #the capped games did not really survive: they are left out of the survival and steps per food figures
+        finished = [game for game in games if not game['capped']]
+        ticks = [game['ticks'] for game in finished]
+        foods = sum(game['foods'] for game in finished)
+        report.append({
+            'strategy': strategy_name,
+            'difficulty': difficulty,
+            'barrier': barrier,
+            'mode': mode,
+            'games': len(games),
+            'score_mean': sum(scores) / len(scores),
+            'score_p50': percentile(scores, 50),
+            'score_p90': percentile(scores, 90),
+            'ticks_mean': sum(ticks) / len(ticks) if ticks else None,
+            'ticks_p50': percentile(ticks, 50) if ticks else None,
+            'ticks_p90': percentile(ticks, 90) if ticks else None,
+            'steps_per_food': sum(ticks) / foods if foods else None,
+            'crash_rate': sum(game['crashed'] for game in games) / len(games),
+            'capped_rate': sum(game['capped'] for game in games) / len(games),
+        })
+    return report
+
+#to print the report as a table
+def print_report(report):
+    #value of a figure, or "-" if it is missing (e.g. all the games were capped)
+    def figure(value, spec=""):
+        return format(value, spec) if value is not None else "-"
+
+    header = (f"{'strategy':<12} {'difficulty':<10} {'barrier':<8} {'mode':<7} {'games':>5} "
+              f"{'score':>8} {'p50':>6} {'p90':>6} {'ticks':>8} {'p50':>6} {'p90':>6} {'steps/food':>10} "
+              f"{'crash':>6} {'capped':>6}")
+    print(header)
+    print("-" * len(header))
+    for row in report:
+        print(f"{row['strategy']:<12} {row['difficulty']:<10} {row['barrier']:<8} {row['mode']:<7} {row['games']:>5} "
+              f"{row['score_mean']:>8.1f} {row['score_p50']:>6} {row['score_p90']:>6} "
+              f"{figure(row['ticks_mean'], '.1f'):>8} {figure(row['ticks_p50']):>6} {figure(row['ticks_p90']):>6} "
+              f"{figure(row['steps_per_food'], '.1f'):>10} {row['crash_rate']:>6.0%} {row['capped_rate']:>6.0%}")
+
 if __name__ == "__main__":
-    game = Game()
-    game.run()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="The Great Snake Game")
+    parser.add_argument("--record", metavar="PATH",
+                        help="record the games to a video/GIF (needs ffmpeg) or to a folder of PNG frames")
+    parser.add_argument("--latency", action="store_true",
+                        help="print the histogram of the input-to-move latency when the game is closed "
+                             "(timed from when the key event is read, up to one frame after the key press)")
+    parser.add_argument("--evaluate", nargs="+", metavar="STRATEGY",
+                        help="play headless games with the given AI strategies (greedy, random or module:function) "
+                             "for every difficulty, barrier and mode, and print the aggregated results")
+    parser.add_argument("--games", type=int, default=10, help="games per strategy and settings (with --evaluate)")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the first game (with --evaluate)")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (with --evaluate, default: all cores)")
+    parser.add_argument("--max-ticks", type=int, default=20000, help="maximum moves of a game (with --evaluate)")
+    parser.add_argument("--report", metavar="PATH", help="also save the evaluation results to a json file")
+    args = parser.parse_args()
+
+    if args.evaluate:
+        try:
+            report = evaluate(args.evaluate, args.games, args.seed, args.workers, args.max_ticks)
+        except (ValueError, ImportError, AttributeError) as error:
+            parser.error(str(error))
+        print_report(report)
+        if args.report:
+            with open(args.report, 'w') as f:
+                json.dump(report, f, indent=2)
+        raise SystemExit
+
+    try:
+        recorder = FrameRecorder(args.record) if args.record else None
+    except ValueError as error:
+        parser.error(str(error))
+    game = Game(recorder)
+    try:
+        game.run()
+    finally:
+        if recorder is not None:
+            recorder.close()
+        if args.latency:
+            print(game.input_latency.report())
\ No newline at end of file